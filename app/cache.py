@@ -0,0 +1,30 @@
+"""Per-worker response-cache helpers shared by the routers."""
+
+import itertools
+
+from cachetools import TTLCache
+
+# One counter for every VersionCache in the process, so a version is never
+# handed out twice.
+_versions = itertools.count(1)
+
+
+class VersionCache(TTLCache):
+    """Invalidation versions for a body cache whose keys include them.
+
+    A bump stores a fresh value from the process-wide counter, so a key whose
+    entry expired never gets back a version an older body is still keyed on.
+    Entries only need to outlive the bodies cached under them, so they expire
+    too; one evicted for size may still be in use, so that clears ``bodies``.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, bodies: TTLCache):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self._bodies = bodies
+
+    def popitem(self):
+        self._bodies.clear()
+        return super().popitem()
+
+    def bump(self, key) -> None:
+        self[key] = next(_versions)
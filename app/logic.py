@@ -1,28 +1,36 @@
 ﻿import hashlib
 import json
-from typing import Any, Dict, List, Optional
+from typing import Any, List, Optional
+from uuid import UUID
+
+import orjson
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, UUID):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def json_dumps(obj: Any, sort_keys: bool = False) -> bytes:
+    # orjson only encodes integers that fit in 64 bits; anything wider (which
+    # jsonb stores exactly) goes through the stdlib encoder with the same
+    # compact separators instead of surfacing as a 500.
+    try:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else None)
+    except orjson.JSONEncodeError:
+        return json.dumps(
+            obj,
+            sort_keys=sort_keys,
+            separators=(",", ":"),
+            ensure_ascii=False,
+            allow_nan=False,
+            default=_json_default,
+        ).encode("utf-8")
 
 def canonical_json_sha256(obj: Any) -> str:
-    raw = json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
-    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    # Compact, key-sorted UTF-8 bytes, so there is no str → bytes re-encode.
+    return hashlib.sha256(json_dumps(obj, sort_keys=True)).hexdigest()
 
 def parse_csv(value: Optional[str]) -> List[str]:
     if not value:
         return []
     return [v.strip() for v in value.split(",") if v.strip()]
-
-def is_allowed(
-    requester_id: str,
-    requester_scopes: List[str],
-    permissions: Dict[str, Any]
-) -> bool:
-    deny = set(permissions.get("deny_list") or [])
-    if requester_id in deny:
-        return False
-    readers = set(permissions.get("readers") or [])
-    if requester_id in readers:
-        return True
-    allowed_scopes = set(permissions.get("scopes") or [])
-    if allowed_scopes and any(s in allowed_scopes for s in requester_scopes):
-        return True
-    return False
@@ -1,21 +1,29 @@
 
 
-import json
 from uuid import UUID, uuid4
 from datetime import datetime, timezone
-import os
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, Header, Depends, HTTPException, Query, Response
+from fastapi import FastAPI, Header, Depends, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
 from asyncpg.exceptions import UniqueViolationError
+from cachetools import TTLCache
+import orjson
 
-from app.db import get_pool, close_pool
+from app.cache import VersionCache
+from app.db import Listener, get_pool, close_pool
 from app.models import (
     CreateCorrectionRequest, CreateCorrectionResponse,
-    FactsResponse, FactItem, HistoryResponse, HistoryItem,
-    Subject, Actor, CorrectionStatus, CorrectionClass,
+    FactsResponse, HistoryResponse, CorrectionStatus,
+)
+from app.logic import canonical_json_sha256, json_dumps, parse_csv
+from app.origin import ORIGIN_JSON
+from app.responses import UTCJSONResponse
+from app.queries import (
+    CORRECTION_LOOKUP, CORRECTION_WRITE, FACTS_SELECT, HISTORY_SELECT,
+    INVALIDATE_CHANNEL, NOTIFY_INVALIDATE,
 )
-from app.logic import canonical_json_sha256, parse_csv, is_allowed
 
 
 # ─────────────────────────────────────────────────────────────
@@ -23,7 +31,15 @@ from app.logic import canonical_json_sha256, parse_csv, is_allowed
 # ─────────────────────────────────────────────────────────────
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # Open the pool before serving, so no request pays for connection setup;
+    # handlers take it from request.app.state.pool.
+    app.state.pool = await get_pool()
+    listener = Listener(INVALIDATE_CHANNEL, _on_invalidate, on_reset=_FACTS_CACHE.clear)
+    await listener.start()
+    enforcement.start_heartbeat_writer(app.state.pool)
     yield
+    await enforcement.stop_heartbeat_writer(app.state.pool)
+    await listener.close()
     await close_pool()
 
 
@@ -31,18 +47,55 @@ app = FastAPI(
     title="Stet API",
     version="1.0.0",
     lifespan=lifespan,
+    default_response_class=UTCJSONResponse,
 )
 
 
+@app.exception_handler(RequestValidationError)
+async def request_validation_error(request: Request, exc: RequestValidationError):
+    # FastAPI's default handler renders with the stdlib encoder, which refuses
+    # the NaN/Infinity inputs echoed back in the errors and turns the 422 into a 500.
+    return UTCJSONResponse({"detail": jsonable_encoder(exc.errors())}, status_code=422)
+
+
 # ─────────────────────────────────────────────────────────────
 # Utilities
 # ─────────────────────────────────────────────────────────────
-def rate_limit_headers() -> dict:
-    return {
-        "X-RateLimit-Limit": "60",
-        "X-RateLimit-Remaining": "59",
-        "X-RateLimit-Reset": "0",
-    }
+# Static, so encoded once and appended to Response.raw_headers as-is
+# (MutableHeaders.update would re-encode and lower-case them per request).
+RATE_LIMIT_HEADERS = [
+    (b"x-ratelimit-limit", b"60"),
+    (b"x-ratelimit-remaining", b"59"),
+    (b"x-ratelimit-reset", b"0"),
+]
+
+
+def api_response(content, status_code: int = 200) -> UTCJSONResponse:
+    """Wrap a handler's plain-dict body, with the rate-limit headers."""
+    resp = UTCJSONResponse(content, status_code=status_code)
+    resp.raw_headers.extend(RATE_LIMIT_HEADERS)
+    return resp
+
+
+# Facts bodies, keyed by everything that shapes the result plus the subject's
+# write version. create_correction bumps the version after its commit, so later
+# reads in this process miss and re-query; every other worker bumps it when the
+# write's NOTIFY arrives. The TTL bounds staleness if a notification is lost.
+_FACTS_CACHE: TTLCache = TTLCache(maxsize=10_000, ttl=5)
+
+
+# The TTL covers a body's own TTL plus a read that captured the version just
+# before a bump and stored its result up to command_timeout later.
+_tenant_subject_version = VersionCache(maxsize=100_000, ttl=60, bodies=_FACTS_CACHE)
+
+
+def _bump_subject_version(subject_key: tuple) -> None:
+    _tenant_subject_version.bump(subject_key)
+
+
+def _on_invalidate(conn, pid, channel, payload: str) -> None:
+    tenant_id, subject_type, subject_id = orjson.loads(payload)
+    _bump_subject_version((UUID(tenant_id), subject_type, subject_id))
 
 
 def require_tenant(x_tenant_id: UUID = Header(..., alias="X-Tenant-Id")) -> UUID:
@@ -62,13 +115,13 @@ def health():
 # ─────────────────────────────────────────────────────────────
 @app.post("/v1/corrections", response_model=CreateCorrectionResponse)
 async def create_correction(
+    request: Request,
     payload: CreateCorrectionRequest,
-    response: Response,
     tenant_id: UUID = Depends(require_tenant),
 ):
-    response.headers.update(rate_limit_headers())
-
-    perms = payload.permissions.model_dump(exclude_none=True)
+    # One model walk feeds both the permissions column and the idempotency hash.
+    dumped = payload.model_dump(by_alias=True)
+    perms = {k: v for k, v in dumped["permissions"].items() if v is not None}
     if not perms.get("readers") and not perms.get("scopes"):
         raise HTTPException(
             400,
@@ -81,20 +134,23 @@ async def create_correction(
             },
         )
 
-    payload_hash = canonical_json_sha256(payload.model_dump(by_alias=True))
-    pool = await get_pool()
+    payload_hash = canonical_json_sha256(dumped)
+    pool = request.app.state.pool
 
     async with pool.acquire() as conn:
         async with conn.transaction():
-            idem = await conn.fetchrow(
-                "SELECT correction_id, payload_hash FROM idempotency "
-                "WHERE tenant_id=$1 AND key=$2",
+            lookup = await conn.fetchrow(
+                CORRECTION_LOOKUP,
                 tenant_id,
                 payload.idempotency_key,
+                payload.supersedes,
+                payload.subject.type,
+                payload.subject.id,
+                payload.field_key,
             )
 
-            if idem:
-                if idem["payload_hash"] != payload_hash:
+            if lookup["idem_correction_id"]:
+                if lookup["payload_hash"] != payload_hash:
                     raise HTTPException(
                         409,
                         detail={
@@ -106,109 +162,59 @@ async def create_correction(
                         },
                     )
 
-                existing = await conn.fetchrow(
-                    "SELECT correction_id, status, supersedes, created_at "
-                    "FROM corrections WHERE correction_id=$1",
-                    idem["correction_id"],
-                )
-
-                response.status_code = 200
-                return CreateCorrectionResponse(
-                    correction_id=existing["correction_id"],
-                    status=existing["status"],
-                    supersedes=existing["supersedes"],
-                    created_at=existing["created_at"],
-                )
-
-            superseded_id = None
+                return api_response({
+                    "correction_id": lookup["idem_correction_id"],
+                    "status": lookup["idem_status"],
+                    "supersedes": lookup["idem_supersedes"],
+                    "created_at": lookup["idem_created_at"],
+                })
 
             if payload.supersedes:
-                target = await conn.fetchrow(
-                    "SELECT correction_id, subject_type, subject_id, field_key, status "
-                    "FROM corrections WHERE tenant_id=$1 AND correction_id=$2",
-                    tenant_id,
-                    payload.supersedes,
-                )
-
-                if not target or target["status"] != CorrectionStatus.ACTIVE.value:
+                if lookup["target_status"] != CorrectionStatus.ACTIVE.value:
                     raise HTTPException(400, detail="Invalid supersedes target")
 
-                superseded_id = target["correction_id"]
+                superseded_id = lookup["target_id"]
             else:
-                existing_active = await conn.fetchrow(
-                    "SELECT correction_id FROM corrections "
-                    "WHERE tenant_id=$1 AND subject_type=$2 AND subject_id=$3 "
-                    "AND field_key=$4 AND status='ACTIVE'",
-                    tenant_id,
-                    payload.subject.type,
-                    payload.subject.id,
-                    payload.field_key,
-                )
-                superseded_id = existing_active["correction_id"] if existing_active else None
+                superseded_id = lookup["active_id"]
 
             new_id = uuid4()
             now = datetime.now(timezone.utc)
 
-            origin = {
-                "service": os.getenv("STET_SERVICE", "stet-api"),
-                "version": os.getenv("STET_VERSION", "dev"),
-                "environment": os.getenv("STET_ENV", "local"),
-            }
-
-            if superseded_id:
-                await conn.execute(
-                    "UPDATE corrections SET status='SUPERSEDED' "
-                    "WHERE tenant_id=$1 AND correction_id=$2",
-                    tenant_id,
-                    superseded_id,
-                )
-
             try:
                 await conn.execute(
-                    """
-                    INSERT INTO corrections (
-                        correction_id, tenant_id, subject_type, subject_id,
-                        field_key, value, class, status, supersedes,
-                        permissions, actor_type, actor_id,
-                        idempotency_key, created_at, origin
-                    ) VALUES (
-                        $1,$2,$3,$4,$5,$6,$7,'ACTIVE',$8,$9,$10,$11,$12,$13,$14
-                    )
-                    """,
+                    CORRECTION_WRITE,
                     new_id,
                     tenant_id,
                     payload.subject.type,
                     payload.subject.id,
                     payload.field_key,
-                    json.dumps(payload.value),
+                    json_dumps(payload.value),
                     payload.class_.value,
                     superseded_id,
-                    json.dumps(perms),
+                    perms,
                     payload.actor.type,
                     payload.actor.id,
                     payload.idempotency_key,
                     now,
-                    json.dumps(origin),
+                    ORIGIN_JSON,
+                    payload_hash,
                 )
             except UniqueViolationError:
                 raise HTTPException(409, detail="Concurrent write violation")
 
-            await conn.execute(
-                "INSERT INTO idempotency (tenant_id, key, correction_id, payload_hash) "
-                "VALUES ($1,$2,$3,$4)",
-                tenant_id,
-                payload.idempotency_key,
-                new_id,
-                payload_hash,
-            )
+        await conn.execute(
+            NOTIFY_INVALIDATE,
+            orjson.dumps([str(tenant_id), payload.subject.type, payload.subject.id]).decode(),
+        )
 
-            response.status_code = 201
-            return CreateCorrectionResponse(
-                correction_id=new_id,
-                status=CorrectionStatus.ACTIVE,
-                supersedes=superseded_id,
-                created_at=now,
-            )
+    _bump_subject_version((tenant_id, payload.subject.type, payload.subject.id))
+
+    return api_response({
+        "correction_id": new_id,
+        "status": CorrectionStatus.ACTIVE,
+        "supersedes": superseded_id,
+        "created_at": now,
+    }, status_code=201)
 
 
 # ─────────────────────────────────────────────────────────────
@@ -216,7 +222,7 @@ async def create_correction(
 # ─────────────────────────────────────────────────────────────
 @app.get("/v1/facts", response_model=FactsResponse)
 async def get_facts(
-    response: Response,
+    request: Request,
     subject_type: str = Query(...),
     subject_id: str = Query(...),
     requester_id: str = Query(...),
@@ -225,41 +231,43 @@ async def get_facts(
     q: str | None = Query(None),
     tenant_id: UUID = Depends(require_tenant),
 ):
-    response.headers.update(rate_limit_headers())
-
     scopes_list = parse_csv(requester_scopes)
-    field_keys_list = parse_csv(field_keys)
 
-    pool = await get_pool()
+    # field_keys and q are accepted but not applied.
+    cache_key = (
+        tenant_id, subject_type, subject_id, requester_id,
+        tuple(sorted(scopes_list)),
+        _tenant_subject_version.get((tenant_id, subject_type, subject_id), 0),
+    )
+    body = _FACTS_CACHE.get(cache_key)
+    if body is not None:
+        return api_response(body)
+
+    pool = request.app.state.pool
     async with pool.acquire() as conn:
         rows = await conn.fetch(
-            "SELECT correction_id, field_key, value, permissions, created_at, "
-            "actor_type, actor_id FROM corrections "
-            "WHERE tenant_id=$1 AND subject_type=$2 AND subject_id=$3 "
-            "AND status='ACTIVE' AND class='FACT'",
+            FACTS_SELECT,
             tenant_id,
             subject_type,
             subject_id,
+            requester_id,
+            scopes_list,
         )
 
-    permitted = []
-    for r in rows:
-        perms = json.loads(r["permissions"]) if isinstance(r["permissions"], str) else r["permissions"]
-        if is_allowed(requester_id, scopes_list, perms):
-            permitted.append(r)
-
     facts = [
-        FactItem(
-            field_key=r["field_key"],
-            value=r["value"],
-            corrected_at=r["created_at"],
-            correction_id=r["correction_id"],
-            actor=Actor(type=r["actor_type"], id=r["actor_id"]),
-        )
-        for r in permitted
+        {
+            "field_key": r["field_key"],
+            "value": r["value"],
+            "corrected_at": r["created_at"],
+            "correction_id": r["correction_id"],
+            "actor": {"type": r["actor_type"], "id": r["actor_id"]},
+        }
+        for r in rows
     ]
 
-    return FactsResponse(subject=Subject(type=subject_type, id=subject_id), facts=facts)
+    body = {"subject": {"type": subject_type, "id": subject_id}, "facts": facts}
+    _FACTS_CACHE[cache_key] = body
+    return api_response(body)
 
 
 # ─────────────────────────────────────────────────────────────
@@ -267,7 +275,7 @@ async def get_facts(
 # ─────────────────────────────────────────────────────────────
 @app.get("/v1/history", response_model=HistoryResponse)
 async def get_history(
-    response: Response,
+    request: Request,
     subject_type: str = Query(...),
     subject_id: str = Query(...),
     requester_id: str = Query(...),
@@ -276,44 +284,32 @@ async def get_history(
     include_revoked: bool = Query(False),
     tenant_id: UUID = Depends(require_tenant),
 ):
-    response.headers.update(rate_limit_headers())
-
     scopes_list = parse_csv(requester_scopes)
-    pool = await get_pool()
+    pool = request.app.state.pool
 
-    async with pool.acquire() as conn:
-        sql = (
-            "SELECT correction_id, field_key, value, class, status, supersedes, "
-            "permissions, created_at, actor_type, actor_id "
-            "FROM corrections WHERE tenant_id=$1 AND subject_type=$2 AND subject_id=$3"
-        )
-        params = [tenant_id, subject_type, subject_id]
-
-        if not include_revoked:
-            sql += " AND status != 'REVOKED'"
+    params = [tenant_id, subject_type, subject_id, requester_id, scopes_list]
+    if field_key:
+        params.append(field_key)
 
-        if field_key:
-            sql += " AND field_key=$4"
-            params.append(field_key)
-
-        sql += " ORDER BY created_at DESC"
-        rows = await conn.fetch(sql, *params)
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(HISTORY_SELECT[(include_revoked, bool(field_key))], *params)
 
     history = [
-        HistoryItem(
-            correction_id=r["correction_id"],
-            field_key=r["field_key"],
-            value=r["value"],
-            class_=CorrectionClass(r["class"]),
-            status=CorrectionStatus(r["status"]),
-            supersedes=r["supersedes"],
-            created_at=r["created_at"],
-            actor=Actor(type=r["actor_type"], id=r["actor_id"]),
-        )
+        {
+            "correction_id": r["correction_id"],
+            "field_key": r["field_key"],
+            "value": r["value"],
+            "class": r["class"],
+            "status": r["status"],
+            "supersedes": r["supersedes"],
+            "superseded_by": r["superseded_by"],
+            "created_at": r["created_at"],
+            "actor": {"type": r["actor_type"], "id": r["actor_id"]},
+        }
         for r in rows
     ]
 
-    return HistoryResponse(subject=Subject(type=subject_type, id=subject_id), history=history)
+    return api_response({"subject": {"type": subject_type, "id": subject_id}, "history": history})
 
 
 # ─────────────────────────────────────────────────────────────
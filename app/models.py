@@ -1,4 +1,5 @@
-﻿from pydantic import BaseModel, ConfigDict, Field
+﻿import math
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from typing import Any, List, Optional
 from enum import Enum
 from uuid import UUID
@@ -29,6 +30,15 @@ class Permissions(BaseModel):
     scopes: Optional[List[str]] = None
     deny_list: Optional[List[str]] = None
 
+def _has_non_finite(value: Any) -> bool:
+    if isinstance(value, float):
+        return not math.isfinite(value)
+    if isinstance(value, dict):
+        return any(_has_non_finite(v) for v in value.values())
+    if isinstance(value, list):
+        return any(_has_non_finite(v) for v in value)
+    return False
+
 class CreateCorrectionRequest(BaseModel):
     model_config = ConfigDict(extra="forbid", populate_by_name=True)
     subject: Subject
@@ -40,6 +50,15 @@ class CreateCorrectionRequest(BaseModel):
     idempotency_key: str
     supersedes: Optional[UUID] = None
 
+    @field_validator("value")
+    @classmethod
+    def _finite_value(cls, v: Any) -> Any:
+        # NaN/Infinity are accepted by the JSON body parser but have no JSON or
+        # jsonb form; orjson would store them as null.
+        if _has_non_finite(v):
+            raise ValueError("value must not contain NaN or Infinity")
+        return v
+
 class CreateCorrectionResponse(BaseModel):
     model_config = ConfigDict(extra="forbid")
     correction_id: UUID
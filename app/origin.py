@@ -0,0 +1,13 @@
+"""Origin attestation stamped on corrections and heartbeats."""
+
+import os
+
+import orjson
+
+# Fixed for the process lifetime, so serialized once; the jsonb codec passes
+# bytes through as already-encoded JSON.
+ORIGIN_JSON = orjson.dumps({
+    "service": os.getenv("STET_SERVICE", "stet-api"),
+    "version": os.getenv("STET_VERSION", "dev"),
+    "environment": os.getenv("STET_ENV", "local"),
+})
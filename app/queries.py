@@ -0,0 +1,188 @@
+﻿"""SQL shared by the route handlers.
+
+Statements live at module level so every call sends byte-identical text.
+asyncpg keeps a per-connection cache of server-side prepared statements keyed
+on that text, so each statement is parsed and planned once per pooled
+connection rather than once per request.
+"""
+
+# ─────────────────────────────────────────────────────────────
+# CORRECTIONS (WRITE PATH)
+# ─────────────────────────────────────────────────────────────
+
+# Everything create_correction needs to decide what to write, in one round
+# trip: the idempotency record joined to the correction it points at (so a
+# replay can answer straight away), the explicit supersedes target ($3) and —
+# only when no target was given — the currently ACTIVE correction for the field.
+CORRECTION_LOOKUP = """
+SELECT
+    i.correction_id AS idem_correction_id,
+    i.payload_hash,
+    c.status AS idem_status,
+    c.supersedes AS idem_supersedes,
+    c.created_at AS idem_created_at,
+    t.correction_id AS target_id,
+    t.status AS target_status,
+    a.correction_id AS active_id
+FROM (SELECT 1) AS probe
+LEFT JOIN idempotency i
+    ON i.tenant_id = $1 AND i.key = $2
+LEFT JOIN corrections c
+    ON c.correction_id = i.correction_id
+LEFT JOIN corrections t
+    ON t.tenant_id = $1 AND t.correction_id = $3
+LEFT JOIN corrections a
+    ON $3::uuid IS NULL
+    AND a.tenant_id = $1 AND a.subject_type = $4 AND a.subject_id = $5
+    AND a.field_key = $6 AND a.status = 'ACTIVE'
+"""
+
+# Supersede + insert + idempotency record as a single statement. The new row
+# reads its `supersedes` value from the UPDATE, which forces Postgres to retire
+# the old ACTIVE row before the insert is checked against uniq_active_per_field.
+# With $8 NULL the UPDATE matches nothing and `supersedes` stays NULL.
+CORRECTION_WRITE = """
+WITH superseded AS (
+    UPDATE corrections SET status = 'SUPERSEDED'
+    WHERE tenant_id = $2 AND correction_id = $8
+    RETURNING correction_id
+), inserted AS (
+    INSERT INTO corrections (
+        correction_id, tenant_id, subject_type, subject_id,
+        field_key, value, class, status, supersedes,
+        permissions, actor_type, actor_id,
+        idempotency_key, created_at, origin
+    ) VALUES (
+        $1, $2, $3, $4, $5, $6, $7, 'ACTIVE', (SELECT correction_id FROM superseded),
+        $9, $10, $11, $12, $13, $14
+    )
+)
+INSERT INTO idempotency (tenant_id, key, correction_id, payload_hash)
+VALUES ($2, $12, $1, $15)
+"""
+
+# Tells every API worker that a subject's facts changed. Sent after the write
+# commits, on its own: a transaction that has issued NOTIFY holds a
+# database-wide lock through its commit flush, which would serialize every
+# correction commit. Direct updates and deletes (revocations) notify from the
+# trigger in migration 008.
+INVALIDATE_CHANNEL = "stet_invalidate"
+NOTIFY_INVALIDATE = "SELECT pg_notify('" + INVALIDATE_CHANNEL + "', $1)"
+
+
+# ─────────────────────────────────────────────────────────────
+# READ PATH
+# ─────────────────────────────────────────────────────────────
+
+# Permission-first filter, the only copy of the read rule: a requester ($4)
+# on the deny list never reads; otherwise a reader entry or any overlap between
+# the correction's scopes and the requester's ($5) grants access. Keys missing
+# from `permissions` yield NULL, hence the COALESCEs.
+READABLE_BY = """
+NOT coalesce((permissions -> 'deny_list') ? $4, false)
+AND (
+    coalesce((permissions -> 'readers') ? $4, false)
+    OR coalesce((permissions -> 'scopes') ?| $5::text[], false)
+)
+"""
+
+FACTS_SELECT = """
+SELECT correction_id, field_key, value, created_at, actor_type, actor_id
+FROM corrections
+WHERE tenant_id = $1 AND subject_type = $2 AND subject_id = $3
+  AND status = 'ACTIVE' AND class = 'FACT'
+  AND """ + READABLE_BY
+
+def _history_select(include_revoked: bool, by_field: bool) -> str:
+    # superseded_by is held to the same rules as the outer rows: a successor the
+    # requester cannot read, or a hidden revoked one, is not disclosed. Inside
+    # the subquery the unqualified columns resolve to s. A target can be
+    # superseded more than once (revoked successor, then a new write); report
+    # the latest successor.
+    not_revoked = "" if include_revoked else "  AND status != 'REVOKED'\n"
+    return (
+        """
+SELECT correction_id, field_key, value, class, status, supersedes,
+       created_at, actor_type, actor_id,
+       (SELECT s.correction_id FROM corrections s
+        WHERE s.tenant_id = c.tenant_id AND s.supersedes = c.correction_id
+""" + not_revoked + "  AND " + READABLE_BY + """        ORDER BY s.created_at DESC
+        LIMIT 1) AS superseded_by
+FROM corrections c
+WHERE tenant_id = $1 AND subject_type = $2 AND subject_id = $3
+  AND """ + READABLE_BY
+        + not_revoked
+        + ("  AND field_key = $6\n" if by_field else "")
+        + "ORDER BY created_at DESC\n"
+    )
+
+# Keyed by (include_revoked, field_key given); $6 is the field_key.
+HISTORY_SELECT = {
+    (include_revoked, by_field): _history_select(include_revoked, by_field)
+    for include_revoked in (False, True)
+    for by_field in (False, True)
+}
+
+
+# ─────────────────────────────────────────────────────────────
+# ENFORCEMENT
+# ─────────────────────────────────────────────────────────────
+HEARTBEAT_INSERT = """
+INSERT INTO enforcement_heartbeats (
+    tenant_id,
+    system_id,
+    enforced_correction_version,
+    origin
+) VALUES ($1, $2, $3, $4)
+"""
+
+# Staleness is decided in SQL, so rows arrive already classified. The handler
+# passes its deadline (evaluation time minus the threshold) and each row is a
+# plain timestamp comparison, with no per-row interval arithmetic.
+_HEARTBEAT_STATUS_CASE = """
+CASE WHEN reported_at >= {deadline} THEN 'OK' ELSE 'STALE' END AS status
+"""
+
+# Status reads come from enforcement_heartbeats_latest, which a trigger keeps
+# at one row per (tenant, system), so both are primary-key lookups.
+# $1 tenant, $2 system_id, $3 deadline.
+HEARTBEAT_STATUS_ONE = """
+SELECT system_id, enforced_correction_version, reported_at,
+""" + _HEARTBEAT_STATUS_CASE.format(deadline="$3") + """
+FROM enforcement_heartbeats_latest
+WHERE tenant_id = $1 AND system_id = $2
+"""
+
+# $1 tenant, $2 deadline.
+_HEARTBEAT_CLASSIFIED = """
+WITH classified AS (
+    SELECT system_id, enforced_correction_version, reported_at,
+    """ + _HEARTBEAT_STATUS_CASE.format(deadline="$2") + """
+    FROM enforcement_heartbeats_latest
+    WHERE tenant_id = $1
+)
+"""
+
+HEARTBEAT_STATUS_ALL = _HEARTBEAT_CLASSIFIED + """
+SELECT system_id, enforced_correction_version, reported_at, status
+FROM classified
+ORDER BY system_id
+"""
+
+# /escalation lists the systems that are not OK and summarizes all of them as
+# counts. One statement, so the list and the counts come from the same
+# snapshot; the LEFT JOIN keeps the counts row when every system is OK
+# (system_id is then NULL).
+HEARTBEAT_ESCALATION_ALL = _HEARTBEAT_CLASSIFIED + """
+, counts AS (
+    SELECT count(*) FILTER (WHERE status = 'OK') AS ok_systems,
+           count(*) FILTER (WHERE status = 'STALE') AS stale_systems
+    FROM classified
+)
+SELECT counts.ok_systems, counts.stale_systems,
+       affected.system_id, affected.enforced_correction_version,
+       affected.reported_at, affected.status
+FROM counts
+LEFT JOIN classified affected ON affected.status <> 'OK'
+ORDER BY affected.system_id
+"""
@@ -0,0 +1,26 @@
+"""Response classes shared by the routers."""
+
+from uuid import UUID
+
+import orjson
+from fastapi.responses import ORJSONResponse
+
+
+def _orjson_default(obj):
+    # asyncpg returns its own UUID subclass, which orjson does not recognise.
+    if isinstance(obj, UUID):
+        return str(obj)
+    raise TypeError
+
+
+class UTCJSONResponse(ORJSONResponse):
+    """orjson response with the same wire format as Pydantic: UTC datetimes
+    end in "Z", not "+00:00".
+
+    Handlers return it with a plain-dict body built from DB values, which skips
+    FastAPI's response_model validation; response_model stays on the route
+    decorators so the OpenAPI schema is unchanged.
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=_orjson_default, option=orjson.OPT_UTC_Z)
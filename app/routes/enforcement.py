@@ -1,10 +1,21 @@
-﻿from fastapi import APIRouter, Header, HTTPException, Query
+﻿from cachetools import TTLCache
+from fastapi import APIRouter, Header, HTTPException, Query, Request
 from pydantic import BaseModel
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from enum import Enum
+from functools import lru_cache
+from uuid import UUID
+import asyncio
 import os
-import json
-from app.db import get_pool
+from app.cache import VersionCache
+from app.origin import ORIGIN_JSON
+from app.responses import UTCJSONResponse
+from app.queries import (
+    HEARTBEAT_ESCALATION_ALL,
+    HEARTBEAT_INSERT,
+    HEARTBEAT_STATUS_ALL,
+    HEARTBEAT_STATUS_ONE,
+)
 
 router = APIRouter(
     prefix="/v1/enforcement",
@@ -16,6 +27,12 @@ class EnforcementDriftStatus(str, Enum):
     STALE = "STALE"
     MISSING = "MISSING"
 
+# Drift states as the plain strings the SQL CASE emits, so rows, counts and the
+# MISSING fallback all hash and compare as str without going through the enum.
+_OK = EnforcementDriftStatus.OK.value
+_STALE = EnforcementDriftStatus.STALE.value
+_MISSING = EnforcementDriftStatus.MISSING.value
+
 class EnforcementEscalation(str, Enum):
     NONE = "NONE"
     WARN = "WARN"
@@ -50,228 +67,246 @@ class EnforcementEscalationResponse(BaseModel):
     summary: EnforcementEscalationSummary
     affected_systems: list[EnforcementStatusItem]
 
-def _evaluate_status(
-    now: datetime,
-    reported_at: datetime,
-    threshold_seconds: float,
-) -> EnforcementDriftStatus:
-    age_seconds = (now - reported_at).total_seconds()
-    return EnforcementDriftStatus.OK if age_seconds <= threshold_seconds else EnforcementDriftStatus.STALE
+@lru_cache(maxsize=1)
+def _heartbeat_config() -> tuple[int, float, float]:
+    """(interval seconds, grace multiplier, staleness threshold in seconds).
+
+    Read once per process; call _heartbeat_config.cache_clear() after changing
+    the environment. That does not reach _STATUS_CACHE, whose TTL is fixed
+    from the interval at import.
+    """
+    interval = int(os.getenv("STET_HEARTBEAT_INTERVAL_SECONDS", "60"))
+    multiplier = float(os.getenv("STET_HEARTBEAT_GRACE_MULTIPLIER", "2"))
+    return interval, multiplier, interval * multiplier
+
+# Status/escalation bodies, keyed by endpoint, tenant, system_id and the
+# tenant's heartbeat version. A committed heartbeat bumps the version, so reads
+# in this worker re-query straight away; otherwise drift states only move at
+# heartbeat-interval granularity and a body is reused for half an interval.
+# The bump is local: other workers are not notified, so after a 201 they can
+# keep serving MISSING/STALE for that tenant for up to half an interval.
+_STATUS_CACHE: TTLCache = TTLCache(maxsize=10_000, ttl=_heartbeat_config()[0] / 2)
+# Outlives any body keyed on a version, including one from a read that took the
+# version just before a bump and stored its result up to command_timeout later.
+_tenant_heartbeat_version = VersionCache(
+    maxsize=100_000, ttl=_STATUS_CACHE.ttl + 30, bodies=_STATUS_CACHE,
+)
+
+# ─────────────────────────────────────────────────────────────
+# Heartbeat writer
+# ─────────────────────────────────────────────────────────────
+# Heartbeats are queued and written by one background task, so concurrent
+# beats share a single COPY and a single commit instead of paying one
+# INSERT + WAL flush each. Whatever queues up while a batch is being written
+# goes into the next one; callers still wait for their row to commit, so a
+# status read right after a 201 sees it. The queue is bounded: if the database
+# falls behind, new heartbeats get 503 instead of piling up in memory.
+HEARTBEAT_BATCH_MAX = 500
+HEARTBEAT_QUEUE_MAX = 10_000
+
+HEARTBEAT_COLUMNS = ["tenant_id", "system_id", "enforced_correction_version", "origin"]
+
+_heartbeat_queue: "asyncio.Queue[tuple[tuple, asyncio.Future]]" = asyncio.Queue(
+    maxsize=HEARTBEAT_QUEUE_MAX,
+)
+_heartbeat_writer: asyncio.Task | None = None
+
+
+async def _write_heartbeats(pool, batch: list[tuple[tuple, asyncio.Future]]) -> None:
+    async with pool.acquire() as conn:
+        try:
+            async with conn.transaction():
+                await conn.copy_records_to_table(
+                    "enforcement_heartbeats",
+                    records=[record for record, _ in batch],
+                    columns=HEARTBEAT_COLUMNS,
+                )
+        except Exception:
+            # One bad row must not fail its neighbours: retry row by row so
+            # only the offending caller gets the error.
+            for record, waiter in batch:
+                try:
+                    await conn.execute(HEARTBEAT_INSERT, *record)
+                except Exception as exc:
+                    if not waiter.done():
+                        waiter.set_exception(exc)
+                else:
+                    if not waiter.done():
+                        waiter.set_result(None)
+            return
+    for _, waiter in batch:
+        if not waiter.done():
+            waiter.set_result(None)
+
+
+async def _run_heartbeat_writer(pool) -> None:
+    while True:
+        batch = [await _heartbeat_queue.get()]
+        while len(batch) < HEARTBEAT_BATCH_MAX and not _heartbeat_queue.empty():
+            batch.append(_heartbeat_queue.get_nowait())
+        try:
+            await _write_heartbeats(pool, batch)
+        except Exception as exc:
+            for _, waiter in batch:
+                if not waiter.done():
+                    waiter.set_exception(exc)
+
+
+def start_heartbeat_writer(pool) -> None:
+    global _heartbeat_writer
+    _heartbeat_writer = asyncio.create_task(_run_heartbeat_writer(pool))
+
+
+async def stop_heartbeat_writer(pool) -> None:
+    global _heartbeat_writer
+    if _heartbeat_writer is None:
+        return
+    _heartbeat_writer.cancel()
+    try:
+        await _heartbeat_writer
+    except asyncio.CancelledError:
+        pass
+    _heartbeat_writer = None
+    # Flush anything accepted before shutdown.
+    batch = []
+    while not _heartbeat_queue.empty():
+        batch.append(_heartbeat_queue.get_nowait())
+    if batch:
+        await _write_heartbeats(pool, batch)
+
 
 @router.post("/heartbeat", status_code=201)
 async def heartbeat(
     payload: EnforcementHeartbeat,
-    x_tenant_id: str = Header(...),
+    x_tenant_id: UUID = Header(...),
 ):
-    origin = {
-        "service": "stet-api",
-        "environment": os.getenv("STET_ENV", "local"),
-        "version": os.getenv("STET_VERSION", "dev"),
-    }
-    if not origin["service"] or not origin["version"]:
+    waiter = asyncio.get_running_loop().create_future()
+    try:
+        _heartbeat_queue.put_nowait((
+            (x_tenant_id, payload.system_id, payload.enforced_correction_version, ORIGIN_JSON),
+            waiter,
+        ))
+    except asyncio.QueueFull:
         raise HTTPException(
-            status_code=400,
-            detail="origin attestation required",
+            status_code=503,
+            detail="heartbeat backlog full",
+            headers={"Retry-After": "1"},
         )
-    
-    query = """
-    INSERT INTO enforcement_heartbeats (
-        tenant_id,
-        system_id,
-        enforced_correction_version,
-        origin
-    ) VALUES ($1, $2, $3, $4);
-    """
-    
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        await conn.execute(
-            query,
-            x_tenant_id,
-            payload.system_id,
-            payload.enforced_correction_version,
-            json.dumps(origin),
-        )
-    
+    await waiter
+    _tenant_heartbeat_version.bump(x_tenant_id)
+
     return {"status": "ok"}
 
+async def _fetch(pool, query: str, *args):
+    async with pool.acquire() as conn:
+        return await conn.fetch(query, *args)
+
+# Status items are plain dicts shaped like EnforcementStatusItem; the handlers
+# return UTCJSONResponse so FastAPI does not re-validate them.
+def _status_item(row) -> dict:
+    return {
+        "system_id": row["system_id"],
+        "status": row["status"],
+        "enforced_correction_version": row["enforced_correction_version"],
+        "reported_at": row["reported_at"],
+    }
+
+def _missing_item(system_id: str) -> dict:
+    # System has never reported
+    return {
+        "system_id": system_id,
+        "status": _MISSING,
+        "enforced_correction_version": None,
+        "reported_at": None,
+    }
+
+async def _fetch_single(pool, tenant_id: UUID, system_id: str, deadline: datetime) -> dict:
+    """Status item for one system, MISSING if it has never reported."""
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow(HEARTBEAT_STATUS_ONE, tenant_id, system_id, deadline)
+    return _status_item(row) if row else _missing_item(system_id)
+
 @router.get("/status", response_model=EnforcementStatusResponse)
 async def status(
-    x_tenant_id: str = Header(...),
+    request: Request,
+    x_tenant_id: UUID = Header(...),
     system_id: str | None = Query(None),
 ):
-    heartbeat_interval_seconds = int(os.getenv("STET_HEARTBEAT_INTERVAL_SECONDS", "60"))
-    heartbeat_grace_multiplier = float(os.getenv("STET_HEARTBEAT_GRACE_MULTIPLIER", "2"))
+    cache_key = ("status", x_tenant_id, system_id, _tenant_heartbeat_version.get(x_tenant_id, 0))
+    body = _STATUS_CACHE.get(cache_key)
+    if body is not None:
+        return UTCJSONResponse(body)
+
+    heartbeat_interval_seconds, heartbeat_grace_multiplier, threshold_seconds = _heartbeat_config()
     now = datetime.now(timezone.utc)
-    threshold_seconds = heartbeat_interval_seconds * heartbeat_grace_multiplier
+    deadline = now - timedelta(seconds=threshold_seconds)
 
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        if system_id:
-            row = await conn.fetchrow(
-                """
-                SELECT system_id, enforced_correction_version, reported_at
-                FROM enforcement_heartbeats
-                WHERE tenant_id=$1 AND system_id=$2
-                ORDER BY reported_at DESC
-                LIMIT 1
-                """,
-                x_tenant_id,
-                system_id,
-            )
-            if row:
-                status_value = _evaluate_status(now, row["reported_at"], threshold_seconds)
-                systems = [
-                    EnforcementStatusItem(
-                        system_id=row["system_id"],
-                        status=status_value,
-                        enforced_correction_version=row["enforced_correction_version"],
-                        reported_at=row["reported_at"],
-                    )
-                ]
-            else:
-                systems = [
-                    EnforcementStatusItem(
-                        system_id=system_id,
-                        status=EnforcementDriftStatus.MISSING,
-                        enforced_correction_version=None,
-                        reported_at=None,
-                    )
-                ]
-        else:
-            rows = await conn.fetch(
-                """
-                SELECT DISTINCT ON (system_id)
-                    system_id,
-                    enforced_correction_version,
-                    reported_at
-                FROM enforcement_heartbeats
-                WHERE tenant_id=$1
-                ORDER BY system_id, reported_at DESC
-                """,
-                x_tenant_id,
-            )
-            systems = []
-            for row in rows:
-                status_value = _evaluate_status(now, row["reported_at"], threshold_seconds)
-                systems.append(
-                    EnforcementStatusItem(
-                        system_id=row["system_id"],
-                        status=status_value,
-                        enforced_correction_version=row["enforced_correction_version"],
-                        reported_at=row["reported_at"],
-                    )
-                )
+    pool = request.app.state.pool
+    if system_id:
+        systems = [await _fetch_single(pool, x_tenant_id, system_id, deadline)]
+    else:
+        rows = await _fetch(pool, HEARTBEAT_STATUS_ALL, x_tenant_id, deadline)
+        systems = [_status_item(row) for row in rows]
 
-    return EnforcementStatusResponse(
-        evaluated_at=now,
-        heartbeat_interval_seconds=heartbeat_interval_seconds,
-        heartbeat_grace_multiplier=heartbeat_grace_multiplier,
-        systems=systems,
-    )
+    body = {
+        "evaluated_at": now,
+        "heartbeat_interval_seconds": heartbeat_interval_seconds,
+        "heartbeat_grace_multiplier": heartbeat_grace_multiplier,
+        "systems": systems,
+    }
+    _STATUS_CACHE[cache_key] = body
+    return UTCJSONResponse(body)
 
 @router.get("/escalation", response_model=EnforcementEscalationResponse)
 async def escalation(
-    x_tenant_id: str = Header(...),
+    request: Request,
+    x_tenant_id: UUID = Header(...),
     system_id: str | None = Query(None),
 ):
-    heartbeat_interval_seconds = int(os.getenv("STET_HEARTBEAT_INTERVAL_SECONDS", "60"))
-    heartbeat_grace_multiplier = float(os.getenv("STET_HEARTBEAT_GRACE_MULTIPLIER", "2"))
+    cache_key = ("escalation", x_tenant_id, system_id, _tenant_heartbeat_version.get(x_tenant_id, 0))
+    body = _STATUS_CACHE.get(cache_key)
+    if body is not None:
+        return UTCJSONResponse(body)
+
+    _, _, threshold_seconds = _heartbeat_config()
     now = datetime.now(timezone.utc)
-    threshold_seconds = heartbeat_interval_seconds * heartbeat_grace_multiplier
+    deadline = now - timedelta(seconds=threshold_seconds)
 
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        if system_id:
-            # Check specific system
-            row = await conn.fetchrow(
-                """
-                SELECT system_id, enforced_correction_version, reported_at
-                FROM enforcement_heartbeats
-                WHERE tenant_id=$1 AND system_id=$2
-                ORDER BY reported_at DESC
-                LIMIT 1
-                """,
-                x_tenant_id,
-                system_id,
-            )
-            if row:
-                status_value = _evaluate_status(now, row["reported_at"], threshold_seconds)
-                systems = [
-                    EnforcementStatusItem(
-                        system_id=row["system_id"],
-                        status=status_value,
-                        enforced_correction_version=row["enforced_correction_version"],
-                        reported_at=row["reported_at"],
-                    )
-                ]
-            else:
-                # System has never reported - MISSING
-                systems = [
-                    EnforcementStatusItem(
-                        system_id=system_id,
-                        status=EnforcementDriftStatus.MISSING,
-                        enforced_correction_version=None,
-                        reported_at=None,
-                    )
-                ]
-        else:
-            # Tenant-wide: all known systems
-            rows = await conn.fetch(
-                """
-                SELECT DISTINCT ON (system_id)
-                    system_id,
-                    enforced_correction_version,
-                    reported_at
-                FROM enforcement_heartbeats
-                WHERE tenant_id=$1
-                ORDER BY system_id, reported_at DESC
-                """,
-                x_tenant_id,
-            )
-            systems = []
-            for row in rows:
-                status_value = _evaluate_status(now, row["reported_at"], threshold_seconds)
-                systems.append(
-                    EnforcementStatusItem(
-                        system_id=row["system_id"],
-                        status=status_value,
-                        enforced_correction_version=row["enforced_correction_version"],
-                        reported_at=row["reported_at"],
-                    )
-                )
+    counts = {_OK: 0, _STALE: 0, _MISSING: 0}
 
-    # Count status types
-    counts = {
-        EnforcementDriftStatus.OK: 0,
-        EnforcementDriftStatus.STALE: 0,
-        EnforcementDriftStatus.MISSING: 0,
-    }
-    for system in systems:
-        counts[system.status] += 1
+    pool = request.app.state.pool
+    if system_id:
+        # Check specific system
+        system = await _fetch_single(pool, x_tenant_id, system_id, deadline)
+        counts[system["status"]] += 1
+        affected_systems = [] if system["status"] == _OK else [system]
+    else:
+        # Tenant-wide: non-OK systems in full, the rest only as counts, both
+        # from one statement so they agree with each other.
+        rows = await _fetch(pool, HEARTBEAT_ESCALATION_ALL, x_tenant_id, deadline)
+        affected_systems = [_status_item(row) for row in rows if row["system_id"] is not None]
+        counts[_OK] = rows[0]["ok_systems"]
+        counts[_STALE] = rows[0]["stale_systems"]
 
     # Determine escalation level
-    if counts[EnforcementDriftStatus.MISSING] > 0:
+    if counts[_MISSING] > 0:
         escalation_value = EnforcementEscalation.CRITICAL
-    elif counts[EnforcementDriftStatus.STALE] > 0:
+    elif counts[_STALE] > 0:
         escalation_value = EnforcementEscalation.WARN
     else:
         escalation_value = EnforcementEscalation.NONE
 
-    # Only include non-OK systems in affected list
-    affected_systems = [system for system in systems if system.status != EnforcementDriftStatus.OK]
-
-    summary = EnforcementEscalationSummary(
-        total_systems=len(systems),
-        ok=counts[EnforcementDriftStatus.OK],
-        stale=counts[EnforcementDriftStatus.STALE],
-        missing=counts[EnforcementDriftStatus.MISSING],
-    )
-
-    return EnforcementEscalationResponse(
-        tenant_id=x_tenant_id,
-        evaluated_at=now,
-        escalation=escalation_value,
-        summary=summary,
-        affected_systems=affected_systems,
-    )
+    body = {
+        "tenant_id": x_tenant_id,
+        "evaluated_at": now,
+        "escalation": escalation_value,
+        "summary": {
+            "total_systems": sum(counts.values()),
+            "ok": counts[_OK],
+            "stale": counts[_STALE],
+            "missing": counts[_MISSING],
+        },
+        "affected_systems": affected_systems,
+    }
+    _STATUS_CACHE[cache_key] = body
+    return UTCJSONResponse(body)
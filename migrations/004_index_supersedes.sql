@@ -0,0 +1,6 @@
+-- Migration: Index the supersedes chain
+-- Purpose: /v1/history resolves each row's superseded_by with a lookup on (tenant_id, supersedes)
+
+CREATE INDEX IF NOT EXISTS idx_corrections_supersedes
+ON corrections (tenant_id, supersedes)
+WHERE supersedes IS NOT NULL;
@@ -0,0 +1,12 @@
+-- Migration: enforcement_heartbeats table
+-- Purpose: the heartbeat history was only ever created outside the migrations;
+-- 006 builds its latest-per-system table and trigger on top of it
+
+CREATE TABLE IF NOT EXISTS enforcement_heartbeats (
+    heartbeat_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    tenant_id UUID NOT NULL,
+    system_id TEXT NOT NULL,
+    enforced_correction_version TIMESTAMPTZ NOT NULL,
+    origin JSONB NOT NULL,
+    reported_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
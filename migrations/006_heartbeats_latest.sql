@@ -0,0 +1,48 @@
+-- Migration: Latest heartbeat per system
+-- Purpose: /v1/enforcement/status and /escalation read one row per system from
+-- a primary-key lookup instead of searching the heartbeat history
+
+CREATE TABLE IF NOT EXISTS enforcement_heartbeats_latest (
+    tenant_id UUID NOT NULL,
+    system_id TEXT NOT NULL,
+    enforced_correction_version TIMESTAMPTZ NOT NULL,
+    reported_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (tenant_id, system_id)
+);
+
+-- Statement-level so a COPY batch of heartbeats costs one upsert. A system that
+-- beats twice in one batch keeps its newest row; a batch that commits late
+-- never overwrites a newer heartbeat.
+CREATE OR REPLACE FUNCTION enforcement_heartbeats_track_latest() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO enforcement_heartbeats_latest AS latest
+        (tenant_id, system_id, enforced_correction_version, reported_at)
+    SELECT DISTINCT ON (tenant_id, system_id)
+        tenant_id, system_id, enforced_correction_version, reported_at
+    FROM new_rows
+    ORDER BY tenant_id, system_id, reported_at DESC, enforced_correction_version DESC
+    ON CONFLICT (tenant_id, system_id) DO UPDATE
+    SET enforced_correction_version = EXCLUDED.enforced_correction_version,
+        reported_at = EXCLUDED.reported_at
+    WHERE EXCLUDED.reported_at >= latest.reported_at;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_heartbeats_latest ON enforcement_heartbeats;
+CREATE TRIGGER trg_heartbeats_latest
+AFTER INSERT ON enforcement_heartbeats
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION enforcement_heartbeats_track_latest();
+
+-- Backfill from history (the trigger already covers anything inserted from here on)
+INSERT INTO enforcement_heartbeats_latest AS latest
+    (tenant_id, system_id, enforced_correction_version, reported_at)
+SELECT DISTINCT ON (tenant_id, system_id)
+    tenant_id, system_id, enforced_correction_version, reported_at
+FROM enforcement_heartbeats
+ORDER BY tenant_id, system_id, reported_at DESC, enforced_correction_version DESC
+ON CONFLICT (tenant_id, system_id) DO UPDATE
+SET enforced_correction_version = EXCLUDED.enforced_correction_version,
+    reported_at = EXCLUDED.reported_at
+WHERE EXCLUDED.reported_at >= latest.reported_at;
@@ -0,0 +1,6 @@
+-- Migration: Disable JIT for the application role
+-- Purpose: the API only runs short OLTP queries, which never benefit from JIT
+-- compilation. Set as a role default so it applies to every new backend,
+-- including ones reached through PgBouncer, without a client startup parameter
+
+ALTER ROLE CURRENT_USER SET jit = off;
@@ -0,0 +1,43 @@
+-- Migration: Invalidate cached facts on direct corrections changes
+-- Purpose: revocations and other manual edits bypass the API, which only sends
+-- its stet_invalidate notification for its own writes. Notify for updates and
+-- deletes that can change what /v1/facts returns. The API's own
+-- ACTIVE -> SUPERSEDED update is excluded: it already notifies after commit,
+-- and a NOTIFY inside its transaction would serialize correction commits.
+
+CREATE OR REPLACE FUNCTION corrections_notify_invalidate() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify(
+        'stet_invalidate',
+        json_build_array(OLD.tenant_id::text, OLD.subject_type, OLD.subject_id)::text
+    );
+    IF TG_OP = 'UPDATE' AND (NEW.subject_type, NEW.subject_id) IS DISTINCT FROM (OLD.subject_type, OLD.subject_id) THEN
+        PERFORM pg_notify(
+            'stet_invalidate',
+            json_build_array(NEW.tenant_id::text, NEW.subject_type, NEW.subject_id)::text
+        );
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS corrections_notify_update ON corrections;
+CREATE TRIGGER corrections_notify_update
+AFTER UPDATE ON corrections
+FOR EACH ROW
+WHEN (
+    NEW.value IS DISTINCT FROM OLD.value
+    OR NEW.permissions IS DISTINCT FROM OLD.permissions
+    OR NEW.class IS DISTINCT FROM OLD.class
+    OR NEW.subject_type IS DISTINCT FROM OLD.subject_type
+    OR NEW.subject_id IS DISTINCT FROM OLD.subject_id
+    OR (NEW.status IS DISTINCT FROM OLD.status AND NEW.status <> 'SUPERSEDED')
+)
+EXECUTE FUNCTION corrections_notify_invalidate();
+
+DROP TRIGGER IF EXISTS corrections_notify_delete ON corrections;
+CREATE TRIGGER corrections_notify_delete
+AFTER DELETE ON corrections
+FOR EACH ROW
+EXECUTE FUNCTION corrections_notify_invalidate();
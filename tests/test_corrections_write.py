@@ -84,3 +84,85 @@ async def test_idempotency_conflict(client, tenant_headers):
     }, headers=tenant_headers)
 
     assert r2.status_code == 409
+
+@pytest.mark.asyncio
+async def test_create_correction_wide_integer(client, tenant_headers):
+    payload = {
+        "subject": {"type": "user", "id": "user_wide_int"},
+        "field_key": "account.balance_minor",
+        "value": 18446744073709551616,
+        "class": "FACT",
+        "permissions": {"readers": ["bot:support_v2"]},
+        "actor": {"type": "system", "id": "ledger"},
+        "idempotency_key": str(uuid4())
+    }
+
+    r1 = await client.post("/v1/corrections", json=payload, headers=tenant_headers)
+    assert r1.status_code == 201
+
+    r2 = await client.post("/v1/corrections", json=payload, headers=tenant_headers)
+    assert r2.status_code == 200
+    assert r1.json()["correction_id"] == r2.json()["correction_id"]
+
+@pytest.mark.asyncio
+async def test_non_finite_value_rejected(client, tenant_headers):
+    body = (
+        '{"subject": {"type": "user", "id": "user_nan"}, "field_key": "score",'
+        ' "value": %s, "class": "FACT", "permissions": {"readers": ["bot:test"]},'
+        ' "actor": {"type": "system", "id": "test"}, "idempotency_key": "%s"}'
+    )
+
+    for value in ("NaN", "Infinity", '{"nested": [1, -Infinity]}'):
+        r = await client.post(
+            "/v1/corrections",
+            content=body % (value, uuid4()),
+            headers={**tenant_headers, "Content-Type": "application/json"},
+        )
+        assert r.status_code == 422
+
+@pytest.mark.asyncio
+async def test_explicit_supersedes(client, tenant_headers):
+    base = {
+        "subject": {"type": "user", "id": f"user_{uuid4().hex}"},
+        "field_key": "plan.tier",
+        "permissions": {"readers": ["bot:test"]},
+        "actor": {"type": "system", "id": "billing"},
+        "class": "FACT"
+    }
+
+    r1 = await client.post("/v1/corrections", json={**base, "value": "free", "idempotency_key": str(uuid4())}, headers=tenant_headers)
+    assert r1.status_code == 201
+    v1_id = r1.json()["correction_id"]
+
+    r2 = await client.post("/v1/corrections", json={**base, "value": "pro", "supersedes": v1_id, "idempotency_key": str(uuid4())}, headers=tenant_headers)
+    assert r2.status_code == 201
+    assert r2.json()["supersedes"] == v1_id
+
+    r = await client.get("/v1/history", params={
+        "subject_type": "user",
+        "subject_id": base["subject"]["id"],
+        "requester_id": "bot:test"
+    }, headers=tenant_headers)
+    statuses = {h["correction_id"]: h["status"] for h in r.json()["history"]}
+    assert statuses == {v1_id: "SUPERSEDED", r2.json()["correction_id"]: "ACTIVE"}
+
+@pytest.mark.asyncio
+async def test_explicit_supersedes_invalid_target(client, tenant_headers):
+    base = {
+        "subject": {"type": "user", "id": f"user_{uuid4().hex}"},
+        "field_key": "plan.tier",
+        "permissions": {"readers": ["bot:test"]},
+        "actor": {"type": "system", "id": "billing"},
+        "class": "FACT"
+    }
+
+    r1 = await client.post("/v1/corrections", json={**base, "value": "free", "idempotency_key": str(uuid4())}, headers=tenant_headers)
+    v1_id = r1.json()["correction_id"]
+    r2 = await client.post("/v1/corrections", json={**base, "value": "pro", "idempotency_key": str(uuid4())}, headers=tenant_headers)
+    assert r2.json()["supersedes"] == v1_id
+
+    r_superseded = await client.post("/v1/corrections", json={**base, "value": "team", "supersedes": v1_id, "idempotency_key": str(uuid4())}, headers=tenant_headers)
+    assert r_superseded.status_code == 400
+
+    r_unknown = await client.post("/v1/corrections", json={**base, "value": "team", "supersedes": str(uuid4()), "idempotency_key": str(uuid4())}, headers=tenant_headers)
+    assert r_unknown.status_code == 400
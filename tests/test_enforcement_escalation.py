@@ -1,5 +1,6 @@
 ﻿import pytest
 import httpx
+from uuid import uuid4
 
 BASE_URL = "http://localhost:8000"
 
@@ -49,3 +50,27 @@ async def test_escalation_critical():
         assert data["summary"]["missing"] == 1
         assert len(data["affected_systems"]) == 1
         assert data["affected_systems"][0]["status"] == "MISSING"
+
+@pytest.mark.asyncio
+async def test_escalation_clears_after_heartbeat():
+    """Escalation re-evaluates once the missing system reports"""
+    tenant_id = str(uuid4())
+    system_id = f"late-system-{uuid4().hex}"
+    url = f"{BASE_URL}/v1/enforcement/escalation?system_id={system_id}"
+
+    async with httpx.AsyncClient() as client:
+        before = await client.get(url, headers={"X-Tenant-Id": tenant_id})
+        assert before.json()["escalation"] == "CRITICAL"
+
+        await client.post(
+            f"{BASE_URL}/v1/enforcement/heartbeat",
+            json={
+                "system_id": system_id,
+                "enforced_correction_version": "2025-01-01T00:00:00Z"
+            },
+            headers={"X-Tenant-Id": tenant_id}
+        )
+
+        after = await client.get(url, headers={"X-Tenant-Id": tenant_id})
+        assert after.json()["escalation"] == "NONE"
+        assert after.json()["summary"]["ok"] == 1
@@ -0,0 +1,59 @@
+﻿import asyncio
+from datetime import datetime, timezone
+from uuid import uuid4
+
+import pytest
+from fastapi import HTTPException
+
+from app.origin import ORIGIN_JSON
+from app.routes import enforcement
+
+@pytest.mark.asyncio
+async def test_heartbeat_queue_full_returns_503():
+    """A full heartbeat queue sheds load with 503 + Retry-After"""
+    queue = enforcement._heartbeat_queue
+    while not queue.full():
+        queue.put_nowait(((), None))
+    try:
+        payload = enforcement.EnforcementHeartbeat(
+            system_id="shed-system",
+            enforced_correction_version=datetime(2025, 1, 1, tzinfo=timezone.utc),
+        )
+        with pytest.raises(HTTPException) as exc_info:
+            await enforcement.heartbeat(payload, x_tenant_id=uuid4())
+        assert exc_info.value.status_code == 503
+        assert exc_info.value.headers["Retry-After"] == "1"
+    finally:
+        while not queue.empty():
+            queue.get_nowait()
+
+@pytest.mark.asyncio
+async def test_failed_copy_only_fails_bad_row():
+    """A batch whose COPY fails is retried row by row; only the bad row errors"""
+    from app.db import get_pool, close_pool
+    pool = await get_pool()
+    loop = asyncio.get_running_loop()
+    tenant_id = uuid4()
+    version = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    system_ids = ["good-1", "bad\x00system", "good-2"]
+    batch = [
+        ((tenant_id, system_id, version, ORIGIN_JSON), loop.create_future())
+        for system_id in system_ids
+    ]
+
+    try:
+        await enforcement._write_heartbeats(pool, batch)
+
+        good_1, bad, good_2 = (waiter for _, waiter in batch)
+        assert good_1.result() is None
+        assert good_2.result() is None
+        assert bad.exception() is not None
+
+        async with pool.acquire() as conn:
+            stored = await conn.fetch(
+                "SELECT system_id FROM enforcement_heartbeats WHERE tenant_id = $1 ORDER BY system_id",
+                tenant_id,
+            )
+        assert [r["system_id"] for r in stored] == ["good-1", "good-2"]
+    finally:
+        await close_pool()
@@ -1,4 +1,5 @@
-﻿import pytest
+﻿import asyncio
+import pytest
 from uuid import uuid4
 
 @pytest.mark.asyncio
@@ -32,6 +33,7 @@ async def test_permission_first(client, tenant_headers):
     facts = r_allowed.json()["facts"]
     assert len(facts) == 1
     assert facts[0]["field_key"] == "sensitive_data"
+    assert facts[0]["value"] == "secret"
 
 @pytest.mark.asyncio
 async def test_fact_only(client, tenant_headers):
@@ -74,3 +76,111 @@ async def test_cross_subject_isolation(client, tenant_headers):
 
     assert r.status_code == 200
     assert r.json()["facts"] == []
+
+@pytest.mark.asyncio
+async def test_scopes_and_deny_list(client, tenant_headers):
+    await client.post("/v1/corrections", json={
+        "subject": {"type": "user", "id": "user_scoped"},
+        "field_key": "plan",
+        "value": "enterprise",
+        "class": "FACT",
+        "permissions": {"scopes": ["billing"], "deny_list": ["bot:blocked"]},
+        "actor": {"type": "system", "id": "test"},
+        "idempotency_key": str(uuid4())
+    }, headers=tenant_headers)
+
+    params = {"subject_type": "user", "subject_id": "user_scoped"}
+
+    r_scoped = await client.get("/v1/facts", params={
+        **params, "requester_id": "bot:any", "requester_scopes": "support, billing"
+    }, headers=tenant_headers)
+    assert r_scoped.status_code == 200
+    assert [f["field_key"] for f in r_scoped.json()["facts"]] == ["plan"]
+
+    r_other_scope = await client.get("/v1/facts", params={
+        **params, "requester_id": "bot:any", "requester_scopes": "support"
+    }, headers=tenant_headers)
+    assert r_other_scope.json()["facts"] == []
+
+    r_denied = await client.get("/v1/facts", params={
+        **params, "requester_id": "bot:blocked", "requester_scopes": "billing"
+    }, headers=tenant_headers)
+    assert r_denied.json()["facts"] == []
+
+@pytest.mark.asyncio
+async def test_read_after_supersede(client, tenant_headers):
+    params = {
+        "subject_type": "user",
+        "subject_id": "user_reread",
+        "requester_id": "bot:test"
+    }
+    for value in ("v1", "v2"):
+        r_write = await client.post("/v1/corrections", json={
+            "subject": {"type": "user", "id": "user_reread"},
+            "field_key": "plan",
+            "value": value,
+            "class": "FACT",
+            "permissions": {"readers": ["bot:test"]},
+            "actor": {"type": "system", "id": "test"},
+            "idempotency_key": str(uuid4())
+        }, headers=tenant_headers)
+        assert r_write.status_code == 201
+
+        r = await client.get("/v1/facts", params=params, headers=tenant_headers)
+        assert [f["value"] for f in r.json()["facts"]] == [value]
+
+@pytest.mark.asyncio
+async def test_read_wide_integers(client, tenant_headers):
+    subject_id = f"user_{uuid4().hex}"
+    r = await client.post("/v1/corrections", json={
+        "subject": {"type": "user", "id": subject_id},
+        "field_key": "account.limits",
+        "value": [18446744073709551616, -9223372036854775809, 1.5],
+        "class": "FACT",
+        "permissions": {"readers": ["bot:test"]},
+        "actor": {"type": "system", "id": "ledger"},
+        "idempotency_key": str(uuid4())
+    }, headers=tenant_headers)
+    assert r.status_code == 201
+
+    r = await client.get("/v1/facts", params={
+        "subject_type": "user",
+        "subject_id": subject_id,
+        "requester_id": "bot:test"
+    }, headers=tenant_headers)
+
+    assert r.status_code == 200
+    assert r.json()["facts"][0]["value"] == [18446744073709551616, -9223372036854775809, 1.5]
+
+@pytest.mark.asyncio
+async def test_direct_revoke_invalidates_cache(client, tenant_headers):
+    subject_id = f"user_{uuid4().hex}"
+    r = await client.post("/v1/corrections", json={
+        "subject": {"type": "user", "id": subject_id},
+        "field_key": "pii_data",
+        "value": "to_be_deleted",
+        "class": "FACT",
+        "permissions": {"readers": ["bot:test"]},
+        "actor": {"type": "system", "id": "test"},
+        "idempotency_key": str(uuid4())
+    }, headers=tenant_headers)
+    correction_id = r.json()["correction_id"]
+
+    params = {"subject_type": "user", "subject_id": subject_id, "requester_id": "bot:test"}
+    r = await client.get("/v1/facts", params=params, headers=tenant_headers)
+    assert len(r.json()["facts"]) == 1
+
+    # revoke outside the API; the trigger's NOTIFY must drop the cached body
+    from app.db import get_pool, close_pool
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        await conn.execute("UPDATE corrections SET status='REVOKED' WHERE correction_id=$1", correction_id)
+    await close_pool()
+
+    # well inside the 5s cache TTL
+    for _ in range(20):
+        r = await client.get("/v1/facts", params=params, headers=tenant_headers)
+        if r.json()["facts"] == []:
+            break
+        await asyncio.sleep(0.1)
+    assert r.json()["facts"] == []
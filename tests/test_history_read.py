@@ -27,6 +27,11 @@ async def test_history_chain(client, tenant_headers):
     assert "ACTIVE" in statuses
     assert "SUPERSEDED" in statuses
 
+    by_status = {h["status"]: h for h in history}
+    assert by_status["SUPERSEDED"]["superseded_by"] == by_status["ACTIVE"]["correction_id"]
+    assert by_status["ACTIVE"]["supersedes"] == by_status["SUPERSEDED"]["correction_id"]
+    assert by_status["ACTIVE"]["superseded_by"] is None
+
 @pytest.mark.asyncio
 async def test_revoked_handling(client, tenant_headers):
     r1 = await client.post("/v1/corrections", json={
@@ -43,10 +48,12 @@ async def test_revoked_handling(client, tenant_headers):
     correction_id = r1.json()["correction_id"]
 
     # simulate GDPR revoke with direct DB update
-    from app.db import get_pool
+    from app.db import get_pool, close_pool
     pool = await get_pool()
     async with pool.acquire() as conn:
         await conn.execute("UPDATE corrections SET status='REVOKED' WHERE correction_id=$1", correction_id)
+    # the pool is bound to this test's event loop
+    await close_pool()
 
     r_facts = await client.get("/v1/facts", params={
         "subject_type": "user",
@@ -74,3 +81,118 @@ async def test_revoked_handling(client, tenant_headers):
     history = r_hist_inc.json()["history"]
     assert len(history) == 1
     assert history[0]["status"] == "REVOKED"
+
+@pytest.mark.asyncio
+async def test_history_permission_first(client, tenant_headers):
+    await client.post("/v1/corrections", json={
+        "subject": {"type": "user", "id": "user_hist_perm"},
+        "field_key": "status",
+        "value": "active",
+        "class": "FACT",
+        "permissions": {"readers": ["bot:allowed"]},
+        "actor": {"type": "system", "id": "test"},
+        "idempotency_key": str(uuid4())
+    }, headers=tenant_headers)
+
+    r = await client.get("/v1/history", params={
+        "subject_type": "user",
+        "subject_id": "user_hist_perm",
+        "requester_id": "bot:denied"
+    }, headers=tenant_headers)
+
+    assert r.status_code == 200
+    assert r.json()["history"] == []
+
+@pytest.mark.asyncio
+async def test_superseded_by_latest_successor(client, tenant_headers):
+    subject_id = f"user_{uuid4().hex}"
+    base = {
+        "subject": {"type": "user", "id": subject_id},
+        "field_key": "status",
+        "class": "FACT",
+        "permissions": {"readers": ["bot:test"]},
+        "actor": {"type": "system", "id": "test"}
+    }
+
+    r1 = await client.post("/v1/corrections", json={**base, "value": "v1", "idempotency_key": str(uuid4())}, headers=tenant_headers)
+    r2 = await client.post("/v1/corrections", json={**base, "value": "v2", "idempotency_key": str(uuid4())}, headers=tenant_headers)
+    v1_id = r1.json()["correction_id"]
+    v2_id = r2.json()["correction_id"]
+
+    # revoke v2 and restore v1 with direct DB updates, so the next write supersedes v1 again
+    from app.db import get_pool, close_pool
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        await conn.execute("UPDATE corrections SET status='REVOKED' WHERE correction_id=$1", v2_id)
+        await conn.execute("UPDATE corrections SET status='ACTIVE' WHERE correction_id=$1", v1_id)
+    await close_pool()
+
+    r3 = await client.post("/v1/corrections", json={**base, "value": "v3", "idempotency_key": str(uuid4())}, headers=tenant_headers)
+    assert r3.json()["supersedes"] == v1_id
+
+    r = await client.get("/v1/history", params={
+        "subject_type": "user",
+        "subject_id": subject_id,
+        "requester_id": "bot:test",
+        "include_revoked": "true"
+    }, headers=tenant_headers)
+
+    assert r.status_code == 200
+    by_id = {h["correction_id"]: h for h in r.json()["history"]}
+    assert by_id[v1_id]["superseded_by"] == r3.json()["correction_id"]
+
+@pytest.mark.asyncio
+async def test_superseded_by_hides_unreadable_successor(client, tenant_headers):
+    subject_id = f"user_{uuid4().hex}"
+    base = {
+        "subject": {"type": "user", "id": subject_id},
+        "field_key": "status",
+        "class": "FACT",
+        "actor": {"type": "system", "id": "test"}
+    }
+
+    r1 = await client.post("/v1/corrections", json={**base, "value": "v1", "permissions": {"readers": ["bot:a", "bot:b"]}, "idempotency_key": str(uuid4())}, headers=tenant_headers)
+    r2 = await client.post("/v1/corrections", json={**base, "value": "v2", "permissions": {"readers": ["bot:b"]}, "idempotency_key": str(uuid4())}, headers=tenant_headers)
+    assert r2.json()["supersedes"] == r1.json()["correction_id"]
+
+    params = {"subject_type": "user", "subject_id": subject_id}
+    r_a = await client.get("/v1/history", params={**params, "requester_id": "bot:a"}, headers=tenant_headers)
+    history = r_a.json()["history"]
+    assert [h["correction_id"] for h in history] == [r1.json()["correction_id"]]
+    assert history[0]["superseded_by"] is None
+
+    r_b = await client.get("/v1/history", params={**params, "requester_id": "bot:b"}, headers=tenant_headers)
+    by_id = {h["correction_id"]: h for h in r_b.json()["history"]}
+    assert by_id[r1.json()["correction_id"]]["superseded_by"] == r2.json()["correction_id"]
+
+@pytest.mark.asyncio
+async def test_superseded_by_hides_revoked_successor(client, tenant_headers):
+    subject_id = f"user_{uuid4().hex}"
+    base = {
+        "subject": {"type": "user", "id": subject_id},
+        "field_key": "status",
+        "class": "FACT",
+        "permissions": {"readers": ["bot:test"]},
+        "actor": {"type": "system", "id": "test"}
+    }
+
+    r1 = await client.post("/v1/corrections", json={**base, "value": "v1", "idempotency_key": str(uuid4())}, headers=tenant_headers)
+    r2 = await client.post("/v1/corrections", json={**base, "value": "v2", "idempotency_key": str(uuid4())}, headers=tenant_headers)
+    v1_id = r1.json()["correction_id"]
+    v2_id = r2.json()["correction_id"]
+
+    from app.db import get_pool, close_pool
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        await conn.execute("UPDATE corrections SET status='REVOKED' WHERE correction_id=$1", v2_id)
+    await close_pool()
+
+    params = {"subject_type": "user", "subject_id": subject_id, "requester_id": "bot:test"}
+    r = await client.get("/v1/history", params=params, headers=tenant_headers)
+    history = r.json()["history"]
+    assert [h["correction_id"] for h in history] == [v1_id]
+    assert history[0]["superseded_by"] is None
+
+    r = await client.get("/v1/history", params={**params, "include_revoked": "true"}, headers=tenant_headers)
+    by_id = {h["correction_id"]: h for h in r.json()["history"]}
+    assert by_id[v1_id]["superseded_by"] == v2_id